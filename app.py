@@ -3,17 +3,18 @@ Main Streamlit application for the Persona music recommendation system.
 """
 
 import streamlit as st
-import streamlit.components.v1 as components
 import logging
+import numpy as np
+import time
+from datetime import timedelta
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from config import APP_TITLE, APP_DESCRIPTION, MAX_RECOMMENDATIONS
-from spotify_client import SpotifyClient
-from music_recommender import MusicRecommender
+from config import APP_TITLE, APP_DESCRIPTION, MAX_RECOMMENDATIONS, CACHE_DURATION_HOURS, PREFETCH_BATCH_SIZE, PREFETCH_THRESHOLD
 from data_manager import DataManager
+from spotify_embed import EMBED_STYLE, create_spotify_embed_html, validate_spotify_track_id
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +29,39 @@ st.set_page_config(
 )
 
 
+@st.cache_resource(show_spinner=False)
+def get_spotify_client():
+    """Create the Spotify client once and share it across sessions."""
+    # Imported lazily so spotipy loads only when the client is first built
+    from spotify_client import SpotifyClient
+    return SpotifyClient()
+
+
+@st.cache_resource(show_spinner=False)
+def get_recommender():
+    """Load the recommendation model once and share it across sessions."""
+    # Imported lazily so scikit-learn loads only when the model is first built
+    from music_recommender import MusicRecommender
+    return MusicRecommender(data_manager=get_data_manager())
+
+
+@st.cache_resource(show_spinner=False)
+def get_data_manager() -> DataManager:
+    """Create the data manager once and share it across sessions."""
+    return DataManager()
+
+
+@st.cache_data(ttl=timedelta(hours=CACHE_DURATION_HOURS), show_spinner=False)
+def load_song_cache(cache_mtime: float) -> tuple:
+    """Parse the songs cache once per file version (keyed on its mtime) and share it, with its feature matrix
+    and fetch time, across sessions."""
+    # A private manager, so the shared one is not updated only on the runs that miss this cache
+    data_manager = DataManager()
+    songs_data = data_manager.load_cached_songs()
+    song_ids, feat_matrix = data_manager.get_song_features_batch(songs_data)
+    return songs_data, song_ids, feat_matrix, data_manager.cache_fetched_at
+
+
 def initialize_session_state():
     """Initialize Streamlit session state variables."""
     if 'spotify_client' not in st.session_state:
@@ -37,19 +71,43 @@ def initialize_session_state():
         st.session_state.recommender = None
     
     if 'data_manager' not in st.session_state:
-        st.session_state.data_manager = DataManager()
+        st.session_state.data_manager = get_data_manager()
     
     if 'songs_data' not in st.session_state:
         st.session_state.songs_data = {}
     
+    if 'song_ids' not in st.session_state:
+        st.session_state.song_ids = None
+    
+    if 'feat_matrix' not in st.session_state:
+        st.session_state.feat_matrix = None
+    
+    if 'feat_matrix_z' not in st.session_state:
+        st.session_state.feat_matrix_z = None
+    
     if 'current_song' not in st.session_state:
         st.session_state.current_song = None
     
     if 'current_song_id' not in st.session_state:
         st.session_state.current_song_id = None
     
-    if 'rated_songs' not in st.session_state:
-        st.session_state.rated_songs = set()
+    if 'rated_mask' not in st.session_state:
+        st.session_state.rated_mask = None
+    
+    if 'id_to_idx' not in st.session_state:
+        st.session_state.id_to_idx = {}
+    
+    if 'catalog_fetched_at' not in st.session_state:
+        st.session_state.catalog_fetched_at = None
+    
+    if 'next_batch' not in st.session_state:
+        st.session_state.next_batch = None
+    
+    if 'prefetch_offset' not in st.session_state:
+        st.session_state.prefetch_offset = None
+    
+    if 'prefetch_exhausted' not in st.session_state:
+        st.session_state.prefetch_exhausted = False
     
     if 'feedback_count' not in st.session_state:
         st.session_state.feedback_count = 0
@@ -60,6 +118,12 @@ def initialize_session_state():
     if 'use_spotify_embed' not in st.session_state:
         st.session_state.use_spotify_embed = True
 
+    if 'model_stats' not in st.session_state:
+        st.session_state.model_stats = None
+
+    if 'feedback_notice' not in st.session_state:
+        st.session_state.feedback_notice = None
+
 
 def initialize_app():
     """Initialize the application components."""
@@ -67,19 +131,28 @@ def initialize_app():
         with st.spinner("🎵 Initializing Persona..."):
             # Initialize Spotify client
             if st.session_state.spotify_client is None:
-                st.session_state.spotify_client = SpotifyClient()
+                st.session_state.spotify_client = get_spotify_client()
             
             # Initialize recommender
             if st.session_state.recommender is None:
-                st.session_state.recommender = MusicRecommender()
+                st.session_state.recommender = get_recommender()
             
             # Load or fetch songs data
             if not st.session_state.songs_data:
-                # Try to load from cache first
-                cached_songs = st.session_state.data_manager.load_cached_songs()
+                # Try to load from cache first; its fetch time is checked here because the parsed copy
+                # is reused across sessions for longer than the catalog stays fresh
+                cache_file = st.session_state.data_manager.cache_file
+                cached_songs, song_ids, feat_matrix, fetched_at = (
+                    load_song_cache(cache_file.stat().st_mtime) if cache_file.exists() else ({}, None, None, None)
+                )
+                if fetched_at is None or time.time() - fetched_at >= CACHE_DURATION_HOURS * 3600:
+                    cached_songs = {}
                 
                 if cached_songs:
                     st.session_state.songs_data = cached_songs
+                    st.session_state.catalog_fetched_at = fetched_at
+                    st.session_state.song_ids = song_ids
+                    st.session_state.feat_matrix = feat_matrix
                     st.success(f"Loaded {len(cached_songs)} songs from cache")
                 else:
                     # Fetch new songs from Spotify
@@ -93,16 +166,32 @@ def initialize_app():
                         
                         # Cache the data
                         st.session_state.data_manager.save_songs_cache(songs_data)
+                        st.session_state.catalog_fetched_at = st.session_state.data_manager.cache_fetched_at
                         st.success(f"Loaded {len(songs_data)} songs with audio features")
                     else:
                         st.error("Failed to fetch songs from Spotify. Please check your API credentials.")
                         return False
             
+            # Catalog feature matrix for scoring (already built when the songs were loaded or cached)
+            if st.session_state.feat_matrix is None:
+                song_ids, feat_matrix = st.session_state.data_manager.get_song_features_batch(st.session_state.songs_data)
+                st.session_state.song_ids = song_ids
+                st.session_state.feat_matrix = feat_matrix
+            
+            if st.session_state.rated_mask is None:
+                song_ids = st.session_state.song_ids
+                st.session_state.id_to_idx = {sid: i for i, sid in enumerate(song_ids)}
+                st.session_state.rated_mask = np.zeros(len(song_ids), dtype=bool)
+            
             # Train initial model if needed
             if not st.session_state.recommender.is_trained:
                 st.info("Training initial recommendation model...")
                 st.session_state.recommender.train_initial_model(st.session_state.songs_data)
             
+            # Standardize the catalog once with the trained (frozen) scaler
+            if st.session_state.feat_matrix_z is None:
+                st.session_state.feat_matrix_z = st.session_state.recommender.scale_features(st.session_state.feat_matrix)
+            
             # Get initial song recommendation
             if st.session_state.current_song is None:
                 get_next_recommendation()
@@ -116,16 +205,84 @@ def initialize_app():
         return False
 
 
+def prefetch_next_batch():
+    """Start fetching more songs in the background once few unrated songs remain."""
+    rated_mask = st.session_state.rated_mask
+    if st.session_state.next_batch is not None or st.session_state.prefetch_exhausted or rated_mask is None:
+        return
+    
+    if len(rated_mask) - np.count_nonzero(rated_mask) <= PREFETCH_THRESHOLD:
+        # Start searching further in than the songs already in the catalog, then move one
+        # batch further for every prefetch so no result page is requested twice
+        offset = st.session_state.prefetch_offset
+        if offset is None:
+            offset = len(st.session_state.songs_data)
+        st.session_state.prefetch_offset = offset + PREFETCH_BATCH_SIZE
+        st.session_state.next_batch = st.session_state.spotify_client.prefetch_next(PREFETCH_BATCH_SIZE, offset=offset)
+        logger.info(f"Prefetching the next batch of songs (offset {offset})")
+
+
+def merge_prefetched_batch(wait: bool = False):
+    """Add the prefetched songs to the catalog once they have arrived (or, with ``wait``, once they do).
+    
+    A failed batch, or one with no new songs, stops prefetching for the rest of the session.
+    """
+    future = st.session_state.next_batch
+    if future is None or not (wait or future.done()):
+        return
+    
+    st.session_state.next_batch = None
+    try:
+        batch = future.result()
+    except Exception as e:
+        logger.warning(f"Error prefetching songs: {e}")
+        st.session_state.prefetch_exhausted = True
+        return
+    
+    songs_data = st.session_state.songs_data
+    new_songs = {sid: song for sid, song in batch.items() if sid not in songs_data}
+    if not new_songs:
+        logger.info("Prefetch found no new songs, not prefetching again")
+        st.session_state.prefetch_exhausted = True
+        return
+    
+    # Append the new rows to the session's catalog arrays instead of rebuilding them
+    data_manager = st.session_state.data_manager
+    new_ids, new_features = data_manager.get_song_features_batch(new_songs)
+    first_idx = len(st.session_state.song_ids)
+    st.session_state.songs_data = {**songs_data, **new_songs}
+    st.session_state.song_ids = np.concatenate((st.session_state.song_ids, new_ids))
+    st.session_state.feat_matrix = np.vstack((st.session_state.feat_matrix, new_features))
+    st.session_state.feat_matrix_z = np.vstack(
+        (st.session_state.feat_matrix_z, st.session_state.recommender.scale_features(new_features))
+    )
+    st.session_state.rated_mask = np.concatenate((st.session_state.rated_mask, np.zeros(len(new_ids), dtype=bool)))
+    st.session_state.id_to_idx.update((sid, first_idx + i) for i, sid in enumerate(new_ids))
+    
+    # Keep the catalog's original fetch time so adding songs doesn't postpone its refresh
+    data_manager.save_songs_cache(st.session_state.songs_data, fetched_at=st.session_state.catalog_fetched_at)
+    logger.info(f"Added {len(new_ids)} prefetched songs to the catalog")
+
+
 def get_next_recommendation():
     """Get the next song recommendation."""
     try:
         if not st.session_state.songs_data:
             return
         
+        # Apply ratings that have waited too long for a full update batch
+        st.session_state.recommender.flush_if_due()
+        
+        # Pick up songs prefetched in the background; block on them only if every song is rated
+        if st.session_state.rated_mask is not None:
+            merge_prefetched_batch(wait=bool(st.session_state.rated_mask.all()))
+        
         # Get recommendations from model
         recommendations = st.session_state.recommender.predict_preferences(
-            st.session_state.songs_data,
-            exclude_ids=list(st.session_state.rated_songs)
+            st.session_state.feat_matrix_z,
+            st.session_state.song_ids,
+            exclude_mask=st.session_state.rated_mask,
+            top_k=1
         )
         
         if recommendations:
@@ -142,13 +299,16 @@ def get_next_recommendation():
                 st.session_state.current_song_id = song_id
                 st.session_state.current_song = song_data
                 logger.info("Using random song as fallback")
+        
+        # Fetch more songs while this one plays
+        prefetch_next_batch()
     
     except Exception as e:
         logger.error(f"Error getting next recommendation: {e}")
 
 
 def handle_feedback(feedback: int):
-    """Handle user feedback and update the model."""
+    """Handle user feedback and update the model (runs as a button callback, before the panel reruns)."""
     try:
         if st.session_state.current_song_id and st.session_state.current_song:
             # Save feedback
@@ -159,91 +319,34 @@ def handle_feedback(feedback: int):
                 audio_features
             )
             
-            # Update model
-            features_array = st.session_state.data_manager.prepare_features_for_ml(audio_features)
+            # Update model with the song's precomputed (standardized) catalog row
+            song_idx = st.session_state.id_to_idx.get(st.session_state.current_song_id)
+            if song_idx is not None:
+                features_array = st.session_state.feat_matrix_z[song_idx]
+            else:
+                features_array = st.session_state.recommender.scale_features(
+                    st.session_state.data_manager.prepare_features_for_ml(audio_features)
+                )
             st.session_state.recommender.update_model(features_array, feedback)
             
             # Track feedback
-            st.session_state.rated_songs.add(st.session_state.current_song_id)
+            if song_idx is not None:
+                st.session_state.rated_mask[song_idx] = True
             st.session_state.feedback_count += 1
+            refresh_model_stats()
             
-            # Show feedback confirmation
+            # Feedback confirmation, shown by the panel once it reruns
             feedback_text = "👍 Liked" if feedback == 1 else "👎 Disliked"
-            st.success(f"{feedback_text}: {st.session_state.current_song['name']}")
+            st.session_state.feedback_notice = ('success', f"{feedback_text}: {st.session_state.current_song['name']}")
             
             # Get next recommendation
             get_next_recommendation()
             
-            # Rerun to update the display
-            st.rerun()
-            
     except Exception as e:
-        st.error(f"Error processing feedback: {e}")
+        st.session_state.feedback_notice = ('error', f"Error processing feedback: {e}")
         logger.error(f"Feedback handling error: {e}")
 
 
-def create_spotify_embed_html(track_id: str, theme: str = "0") -> str:
-    """
-    Create HTML for Spotify embed iframe with enhanced styling.
-
-    Args:
-        track_id: Spotify track ID
-        theme: "0" for light theme, "1" for dark theme
-    """
-    embed_url = f"https://open.spotify.com/embed/track/{track_id}"
-
-    # Enhanced CSS for responsive iframe with better styling
-    iframe_html = f"""
-    <div style="
-        position: relative;
-        width: 100%;
-        height: 152px;
-        margin: 15px 0;
-        border-radius: 12px;
-        overflow: hidden;
-        box-shadow: 0 8px 16px rgba(0,0,0,0.15);
-        background: linear-gradient(135deg, #1DB954 0%, #1ed760 100%);
-        padding: 2px;
-        transition: transform 0.2s ease, box-shadow 0.2s ease;
-    ">
-        <div style="
-            width: 100%;
-            height: 100%;
-            border-radius: 10px;
-            overflow: hidden;
-            background: white;
-        ">
-            <iframe
-                src="{embed_url}?utm_source=generator&theme={theme}"
-                width="100%"
-                height="152"
-                frameborder="0"
-                allowfullscreen=""
-                allow="autoplay; clipboard-write; encrypted-media; fullscreen; picture-in-picture"
-                loading="lazy"
-                style="border-radius: 10px; display: block;">
-            </iframe>
-        </div>
-    </div>
-    <style>
-        div:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 12px 24px rgba(0,0,0,0.2);
-        }}
-    </style>
-    """
-    return iframe_html
-
-
-def validate_spotify_track_id(track_id: str) -> bool:
-    """Validate if the track ID is in correct Spotify format."""
-    if not track_id or not isinstance(track_id, str):
-        return False
-
-    # Spotify track IDs are 22 characters long and contain alphanumeric characters
-    return len(track_id) == 22 and track_id.isalnum()
-
-
 def display_current_song():
     """Display the current song recommendation with Spotify embed player."""
     if not st.session_state.current_song:
@@ -277,7 +380,7 @@ def display_current_song():
                 try:
                     # Determine theme based on Streamlit theme (default to light)
                     embed_html = create_spotify_embed_html(song_id, theme="0")
-                    components.html(embed_html, height=170)
+                    st.markdown(embed_html, unsafe_allow_html=True)
 
                     # Subtle success indicator
                     st.caption("🎵 Spotify embed player loaded successfully")
@@ -351,23 +454,24 @@ def display_current_song():
     col1, col2, col3 = st.columns([1, 1, 2])
 
     with col1:
-        if st.button("👍 Like", key="like_btn", use_container_width=True):
-            handle_feedback(1)
+        st.button("👍 Like", key="like_btn", use_container_width=True, on_click=handle_feedback, args=(1,))
 
     with col2:
-        if st.button("👎 Dislike", key="dislike_btn", use_container_width=True):
-            handle_feedback(0)
+        st.button("👎 Dislike", key="dislike_btn", use_container_width=True, on_click=handle_feedback, args=(0,))
 
     with col3:
         # Add a skip button for better UX
-        if st.button("⏭️ Skip Song", key="skip_btn", use_container_width=True):
-            get_next_recommendation()
-            st.rerun()
+        st.button("⏭️ Skip Song", key="skip_btn", use_container_width=True, on_click=get_next_recommendation)
+
+
+def refresh_model_stats():
+    """Recompute model statistics once and share them with every panel."""
+    st.session_state.model_stats = st.session_state.recommender.get_model_stats()
 
 
 def display_stats():
     """Display recommendation statistics."""
-    stats = st.session_state.recommender.get_model_stats()
+    stats = st.session_state.model_stats
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -384,6 +488,32 @@ def display_stats():
         st.metric("Available Songs", len(st.session_state.songs_data))
 
 
+@st.fragment
+def display_song_panel():
+    """Display the song card and statistics as a fragment so feedback only reruns this panel."""
+    # Result of the last rating, set by the button callback before this rerun
+    if st.session_state.feedback_notice is not None:
+        kind, message = st.session_state.feedback_notice
+        st.session_state.feedback_notice = None
+        if kind == 'error':
+            st.error(message)
+        else:
+            st.success(message)
+    
+    # Display current song
+    display_current_song()
+    
+    st.divider()
+    
+    # Display statistics
+    st.subheader("📊 Your Music Journey")
+    display_stats()
+    
+    # Progress indicator
+    if st.session_state.feedback_count > 0:
+        st.info(f"🎯 The more you rate, the better your recommendations become!")
+
+
 def main():
     """Main application function."""
     # Initialize session state
@@ -391,6 +521,7 @@ def main():
     
     # App header
     st.title(APP_TITLE)
+    st.markdown(EMBED_STYLE, unsafe_allow_html=True)
     st.markdown(APP_DESCRIPTION)
     st.divider()
     
@@ -401,18 +532,8 @@ def main():
     
     # Main content
     if st.session_state.app_initialized:
-        # Display current song
-        display_current_song()
-        
-        st.divider()
-        
-        # Display statistics
-        st.subheader("📊 Your Music Journey")
-        display_stats()
-        
-        # Progress indicator
-        if st.session_state.feedback_count > 0:
-            st.info(f"🎯 The more you rate, the better your recommendations become!")
+        refresh_model_stats()
+        display_song_panel()
     
     # Sidebar with additional info
     with st.sidebar:
@@ -421,7 +542,7 @@ def main():
 
         if st.session_state.app_initialized:
             st.subheader("Model Status")
-            stats = st.session_state.recommender.get_model_stats()
+            stats = st.session_state.model_stats
             st.write(f"**Model Trained:** {'✅' if stats['is_trained'] else '❌'}")
             st.write(f"**Total Feedback:** {stats['total_feedback']}")
 
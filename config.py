@@ -3,6 +3,7 @@ Configuration settings for the Persona music recommendation system.
 """
 
 import os
+from operator import itemgetter
 from pathlib import Path
 
 # Project paths
@@ -10,18 +11,28 @@ PROJECT_ROOT = Path(__file__).parent
 MODELS_DIR = PROJECT_ROOT / "models"
 DATA_DIR = PROJECT_ROOT / "data"
 
-# Ensure directories exist
-MODELS_DIR.mkdir(exist_ok=True)
-DATA_DIR.mkdir(exist_ok=True)
+# Ensure directories exist (skip the mkdir call when they already do)
+for _directory in (MODELS_DIR, DATA_DIR):
+    if not _directory.exists():
+        _directory.mkdir(parents=True, exist_ok=True)
 
 # Spotify API settings
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "http://localhost:8501/callback")
+SPOTIFY_MARKET = "US"  # Market for search/track lookups (also drops per-track available_markets from responses)
+SPOTIFY_MAX_WORKERS = 4  # Concurrent requests when fetching batched data
+SPOTIFY_RATE_LIMIT = 150  # Max API requests per SPOTIFY_RATE_PERIOD_SECONDS (Spotify allows ~180/min)
+SPOTIFY_RATE_PERIOD_SECONDS = 60
+SPOTIFY_CACHE_PATH = DATA_DIR / "spotify_cache.db"  # Local cache of per-ID track and audio-feature lookups
+SPOTIFY_CACHE_TTL_HOURS = 24 * 7
+SPOTIFY_TOKEN_CACHE_DIR = Path.home() / ".cache" / "persona"  # Client-credentials tokens reused across runs
 
 # Model settings
 MODEL_PATH = MODELS_DIR / "music_recommender.joblib"
 RANDOM_STATE = 42
+UPDATE_BATCH_SIZE = 8  # Feedback samples buffered before an incremental model update
+UPDATE_FLUSH_SECONDS = 60  # Apply buffered feedback once the oldest sample is this old
 
 # Audio features to use for recommendations (when available)
 AUDIO_FEATURES = [
@@ -38,6 +49,19 @@ AUDIO_FEATURES = [
     'tempo'
 ]
 
+# Feature names frozen once at import, with a C-level getter for whole rows
+AUDIO_FEATURE_NAMES = tuple(AUDIO_FEATURES)
+N_AUDIO_FEATURES = len(AUDIO_FEATURE_NAMES)
+_get_audio_features = itemgetter(*AUDIO_FEATURE_NAMES)
+
+
+def feature_values(audio_features: dict) -> tuple:
+    """Return the AUDIO_FEATURES values of one song in order, with 0 for any that are missing."""
+    try:
+        return _get_audio_features(audio_features)
+    except KeyError:
+        return tuple(audio_features.get(feature, 0) for feature in AUDIO_FEATURE_NAMES)
+
 # Fallback features using basic song metadata
 FALLBACK_FEATURES = [
     'popularity',
@@ -49,6 +73,8 @@ FALLBACK_FEATURES = [
 # App settings
 DEFAULT_SEARCH_LIMIT = 50
 MAX_RECOMMENDATIONS = 10
+PREFETCH_BATCH_SIZE = 10  # Songs fetched in the background for the next recommendations
+PREFETCH_THRESHOLD = 10  # Start prefetching once this few unrated songs remain
 CACHE_DURATION_HOURS = 24
 
 # UI settings
@@ -6,16 +6,32 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
+import csv
 import json
+import os
+import time
 import logging
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime
 
-from config import DATA_DIR, AUDIO_FEATURES, FALLBACK_FEATURES, CACHE_DURATION_HOURS
+try:
+    import orjson  # Faster JSON encoding/decoding for the songs cache
+except ImportError:
+    orjson = None
+
+from config import (DATA_DIR, AUDIO_FEATURES, AUDIO_FEATURE_NAMES, N_AUDIO_FEATURES, FALLBACK_FEATURES,
+                    CACHE_DURATION_HOURS, feature_values)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Column order of the feedback log
+FEEDBACK_COLUMNS = ['song_id', 'feedback', 'timestamp'] + AUDIO_FEATURES
+
+# Compact dtypes for the parsed feedback log ('timestamp' is parsed as datetime64)
+_FEEDBACK_DTYPES = {'song_id': 'string', 'feedback': 'int8', **{feature: 'float32' for feature in AUDIO_FEATURES}}
+
 
 class DataManager:
     """Manages data storage, caching, and preprocessing for the music recommendation system."""
@@ -24,95 +40,206 @@ class DataManager:
         self.cache_file = DATA_DIR / "songs_cache.json"
         self.feedback_file = DATA_DIR / "user_feedback.csv"
         self.songs_data = {}
+        # When the cached catalog was fetched from Spotify (epoch seconds); kept across rewrites of the file
+        self.cache_fetched_at: Optional[float] = None
+        # Structure-of-arrays view of songs_data: parallel song IDs and one float32 feature row each
+        self.song_ids = np.empty(0, dtype=object)
+        self.features = np.empty((0, N_AUDIO_FEATURES), dtype=np.float32)
+        # The manager is shared across sessions: songs_data and its arrays are swapped together
+        self._index_lock = threading.Lock()
         self.feedback_data = pd.DataFrame()
+        self._feedback_fp = None
+        self._feedback_writer = None
+        # Parsed feedback log, valid while the file's (mtime_ns, size) matches _feedback_mtime
+        self._feedback_cache: Optional[pd.DataFrame] = None
+        self._feedback_mtime: Optional[Tuple[int, int]] = None
+        # Rows saved since the cache was last materialized, one list per FEEDBACK_COLUMNS entry
+        self._feedback_pending: Dict[str, List] = {column: [] for column in FEEDBACK_COLUMNS}
+        # Guards the log handle, the pending rows and the parsed copy across sessions
+        self._feedback_lock = threading.Lock()
         
     def load_cached_songs(self) -> Dict:
         """Load cached song data from file."""
         try:
             if self.cache_file.exists():
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                    
-                # Check if cache is still valid
-                cache_time = datetime.fromisoformat(cache_data.get('timestamp', '1970-01-01'))
-                if datetime.now() - cache_time < timedelta(hours=CACHE_DURATION_HOURS):
-                    logger.info(f"Loaded {len(cache_data.get('songs', {}))} songs from cache")
-                    return cache_data.get('songs', {})
+                # The fetch time is never later than the mtime (the time of the last atomic save),
+                # so a file that is too old by its mtime is expired without being parsed
+                cache_mtime = self.cache_file.stat().st_mtime
+                if time.time() - cache_mtime >= CACHE_DURATION_HOURS * 3600:
+                    logger.info("Cache expired, will refresh data")
+                    return {}
+                
+                if orjson is not None:
+                    cache_data = orjson.loads(self.cache_file.read_bytes())
                 else:
+                    with open(self.cache_file, 'r', encoding='utf-8') as f:
+                        cache_data = json.load(f)
+                
+                # Songs added later (see save_songs_cache) don't make the catalog any fresher
+                fetched_at = cache_data.get('timestamp')
+                fetched_at = datetime.fromisoformat(fetched_at).timestamp() if fetched_at else cache_mtime
+                if time.time() - fetched_at >= CACHE_DURATION_HOURS * 3600:
                     logger.info("Cache expired, will refresh data")
+                    return {}
+                
+                songs_data = cache_data.get('songs', {})
+                self.cache_fetched_at = fetched_at
+                self._index_songs(songs_data)
+                logger.info(f"Loaded {len(songs_data)} songs from cache")
+                return songs_data
                     
         except Exception as e:
             logger.warning(f"Error loading cache: {e}")
             
         return {}
     
-    def save_songs_cache(self, songs_data: Dict) -> None:
-        """Save song data to cache file."""
+    def save_songs_cache(self, songs_data: Dict, fetched_at: Optional[float] = None) -> None:
+        """Save song data to cache file.
+        
+        ``fetched_at`` keeps the original fetch time when songs are added to an existing catalog;
+        by default the catalog counts as fetched now.
+        """
+        self._index_songs(songs_data)
+        self.cache_fetched_at = fetched_at if fetched_at is not None else time.time()
         try:
             cache_data = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': datetime.fromtimestamp(self.cache_fetched_at).isoformat(),
                 'songs': songs_data
             }
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, ensure_ascii=False)
+            # Compact output: the cache is not meant to be read by hand
+            if orjson is not None:
+                payload = orjson.dumps(cache_data, option=orjson.OPT_SERIALIZE_NUMPY)
+            else:
+                payload = json.dumps(cache_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            
+            # One large write to a temp file, then an atomic swap so readers never see a partial cache
+            tmp_file = self.cache_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb', buffering=1 << 20) as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.cache_file)
             logger.info(f"Cached {len(songs_data)} songs")
         except Exception as e:
             logger.error(f"Error saving cache: {e}")
     
+    def _index_songs(self, songs_data: Dict) -> None:
+        """Keep songs_data and rebuild its song ID array and feature matrix."""
+        song_ids, features = self._build_feature_matrix(songs_data)
+        with self._index_lock:
+            self.songs_data, self.song_ids, self.features = songs_data, song_ids, features
+    
+    def _feedback_file_version(self) -> Optional[Tuple[int, int]]:
+        """Return the feedback log's (mtime_ns, size), or None if it does not exist."""
+        try:
+            stat = self.feedback_file.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
     def load_feedback_data(self) -> pd.DataFrame:
-        """Load user feedback data from CSV file."""
+        """Load user feedback data from CSV file, reusing the parsed copy while the file is unchanged.
+        
+        The returned DataFrame is shared; callers must not modify it in place.
+        """
         try:
-            if self.feedback_file.exists():
-                df = pd.read_csv(self.feedback_file)
-                logger.info(f"Loaded {len(df)} feedback records")
-                return df
+            with self._feedback_lock:
+                version = self._feedback_file_version()
+                if version is not None:
+                    if self._feedback_cache is not None and version == self._feedback_mtime:
+                        if self._feedback_pending['song_id']:
+                            # Materialize the rows saved since the last load with a single concat
+                            pending_df = pd.DataFrame(self._feedback_pending, columns=FEEDBACK_COLUMNS).astype(_FEEDBACK_DTYPES)
+                            pending_df['timestamp'] = pd.to_datetime(pending_df['timestamp'])
+                            self._feedback_cache = pd.concat([self._feedback_cache, pending_df], ignore_index=True)
+                            self._clear_pending_feedback()
+                        return self._feedback_cache
+                
+                    df = pd.read_csv(self.feedback_file, dtype=_FEEDBACK_DTYPES, parse_dates=['timestamp'])
+                    self._clear_pending_feedback()
+                    self._feedback_cache = df
+                    self._feedback_mtime = version
+                    logger.info(f"Loaded {len(df)} feedback records")
+                    return df
         except Exception as e:
             logger.warning(f"Error loading feedback data: {e}")
             
         # Return empty DataFrame with correct columns
-        return pd.DataFrame(columns=['song_id', 'feedback', 'timestamp'] + AUDIO_FEATURES)
+        empty = pd.DataFrame(columns=FEEDBACK_COLUMNS).astype(_FEEDBACK_DTYPES)
+        empty['timestamp'] = pd.to_datetime(empty['timestamp'])
+        return empty
+    
+    def _clear_pending_feedback(self) -> None:
+        """Drop buffered rows once they are part of the cached DataFrame (or the cache is discarded)."""
+        for values in self._feedback_pending.values():
+            values.clear()
+    
+    def _ensure_header(self) -> None:
+        """Open the feedback log for appending, writing the header row if the file is new."""
+        if self._feedback_fp is not None and not self._feedback_fp.closed and self.feedback_file.exists():
+            return
+        
+        if self._feedback_fp is not None:
+            self._feedback_fp.close()
+        
+        is_new = not self.feedback_file.exists() or self.feedback_file.stat().st_size == 0
+        self._feedback_fp = open(self.feedback_file, 'a', newline='', encoding='utf-8', buffering=8192)
+        self._feedback_writer = csv.writer(self._feedback_fp, lineterminator='\n')
+        if is_new:
+            self._feedback_writer.writerow(FEEDBACK_COLUMNS)
     
     def save_feedback(self, song_id: str, feedback: int, audio_features: Dict) -> None:
-        """Save user feedback to CSV file."""
+        """Append a user feedback record to the CSV log."""
         try:
-            # Create new feedback record
-            new_record = {
-                'song_id': song_id,
-                'feedback': feedback,
-                'timestamp': datetime.now().isoformat()
-            }
+            with self._feedback_lock:
+                cache_in_sync = (
+                    self._feedback_cache is not None
+                    and self._feedback_mtime == self._feedback_file_version()
+                )
+                self._ensure_header()
             
-            # Add audio features
-            for feature in AUDIO_FEATURES:
-                new_record[feature] = audio_features.get(feature, 0)
+                # Row layout matches FEEDBACK_COLUMNS
+                row = [song_id, feedback, datetime.now().isoformat()]
+                row.extend(feature_values(audio_features))
             
-            # Load existing data and append
-            df = self.load_feedback_data()
-            new_df = pd.DataFrame([new_record])
-            df = pd.concat([df, new_df], ignore_index=True)
+                self._feedback_writer.writerow(row)
+                self._feedback_fp.flush()
             
-            # Save to file
-            df.to_csv(self.feedback_file, index=False)
-            logger.info(f"Saved feedback for song {song_id}")
+                # Keep the in-memory copy current instead of re-parsing the file on the next load;
+                # rows are buffered column-wise and only turned into a DataFrame when it is loaded
+                if cache_in_sync:
+                    for column, value in zip(FEEDBACK_COLUMNS, row):
+                        self._feedback_pending[column].append(value)
+                    self._feedback_mtime = self._feedback_file_version()
+                else:
+                    self._feedback_cache = None
+                    self._clear_pending_feedback()
+                logger.info(f"Saved feedback for song {song_id}")
             
         except Exception as e:
             logger.error(f"Error saving feedback: {e}")
     
+    def close(self) -> None:
+        """Close the feedback log handle opened for appending."""
+        lock = getattr(self, '_feedback_lock', None)  # May be missing if __init__ did not run to completion
+        if lock is None:
+            return
+        with lock:
+            if self._feedback_fp is not None:
+                self._feedback_fp.close()
+                self._feedback_fp = None
+                self._feedback_writer = None
+    
+    def __del__(self):
+        self.close()
+    
     def prepare_features_for_ml(self, audio_features: Dict) -> np.ndarray:
         """Convert audio features dictionary to numpy array for ML model."""
-        features = []
-
-        # Try to get standard audio features first
-        for feature in AUDIO_FEATURES:
-            if feature in audio_features:
-                features.append(audio_features[feature])
-            else:
-                features.append(0)
+        features = np.array(feature_values(audio_features), dtype=np.float32)
 
         # If we don't have enough features, try fallback features
-        if len([f for f in features if f != 0]) < 3:  # Less than 3 non-zero features
+        if np.count_nonzero(features) < 3:  # Less than 3 non-zero features
             # Use fallback features instead
-            features = []
             fallback_mapping = {
                 'danceability': 'danceability_estimate',
                 'energy': 'energy_estimate',
@@ -121,27 +248,40 @@ class DataManager:
                 'duration_ms': 'duration_normalized',
                 'explicit': 'explicit'
             }
+            features = np.fromiter(
+                (audio_features.get(fallback_mapping.get(feature), 0.5) for feature in AUDIO_FEATURE_NAMES),  # 0.5 = neutral default
+                dtype=np.float32, count=N_AUDIO_FEATURES
+            )
 
-            for feature in AUDIO_FEATURES:
-                fallback_key = fallback_mapping.get(feature)
-                if fallback_key and fallback_key in audio_features:
-                    features.append(audio_features[fallback_key])
-                else:
-                    features.append(0.5)  # Neutral default
-
-        return np.array(features).reshape(1, -1)
+        return features.reshape(1, -1)
     
-    def get_song_features_batch(self, songs_data: Dict) -> Tuple[List[str], np.ndarray]:
-        """Extract features for multiple songs for batch prediction."""
-        song_ids = []
-        features_list = []
+    def get_song_features_batch(self, songs_data: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the catalog's song ID array and its parallel float32 feature matrix.
         
+        Without an argument (or when passed the songs this manager loaded or saved) the arrays
+        built at load/save time are returned as-is; any other dict is converted on the fly.
+        """
+        with self._index_lock:
+            if songs_data is None or songs_data is self.songs_data:
+                return self.song_ids, self.features
+        return self._build_feature_matrix(songs_data)
+    
+    @staticmethod
+    def _build_feature_matrix(songs_data: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """Build one float32 feature row per song with audio features, plus the parallel song ID array."""
+        # One pass over the dicts collecting C-level itemgetter rows, then a single array conversion
+        ids = []
+        rows = []
         for song_id, song_data in songs_data.items():
-            if 'audio_features' in song_data:
-                song_ids.append(song_id)
-                features = []
-                for feature in AUDIO_FEATURES:
-                    features.append(song_data['audio_features'].get(feature, 0))
-                features_list.append(features)
+            audio_features = song_data.get('audio_features')
+            if audio_features is not None:
+                ids.append(song_id)
+                rows.append(feature_values(audio_features))
         
-        return song_ids, np.array(features_list) if features_list else np.array([]).reshape(0, len(AUDIO_FEATURES))
+        features = np.array(rows, dtype=np.float32).reshape(-1, N_AUDIO_FEATURES)
+        return np.array(ids, dtype=object), features
+    
+    def build_exclude_mask(self, song_ids: np.ndarray, exclude_ids) -> np.ndarray:
+        """Return a boolean mask aligned with ``song_ids`` that is True for songs in ``exclude_ids``."""
+        exclude_set = frozenset(exclude_ids or ())
+        return np.fromiter((sid in exclude_set for sid in song_ids), dtype=bool, count=len(song_ids))
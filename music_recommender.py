@@ -3,32 +3,84 @@ Machine learning recommendation engine for the Persona music recommendation syst
 """
 
 import numpy as np
-import pandas as pd
 from sklearn.linear_model import SGDClassifier
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
 import joblib
+import atexit
 import logging
+import threading
+import time
+import weakref
 from typing import Dict, List, Tuple, Optional
 from pathlib import Path
 
-from config import MODEL_PATH, RANDOM_STATE, AUDIO_FEATURES
+from config import (MODEL_PATH, RANDOM_STATE, AUDIO_FEATURES, N_AUDIO_FEATURES, MAX_RECOMMENDATIONS,
+                    UPDATE_BATCH_SIZE, UPDATE_FLUSH_SECONDS)
 from data_manager import DataManager
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Feedback labels: 0 = dislike, 1 = like
+_CLASSES = np.array([0, 1])
+
+# Live recommenders, so feedback still queued at interpreter exit is applied without
+# the exit hook keeping every instance alive
+_instances = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all() -> None:
+    """Apply the queued feedback of every live recommender."""
+    for recommender in list(_instances):
+        recommender.flush()
+
 
 class MusicRecommender:
     """Machine learning recommendation engine using SGDClassifier for incremental learning."""
     
-    def __init__(self):
+    def __init__(self, data_manager: Optional[DataManager] = None, lazy: bool = False):
+        """Create the recommender, reusing ``data_manager`` if given.
+        
+        With ``lazy=True`` the model is loaded (or created) on first use instead of here.
+        """
         self.model = None
         self.scaler = None
-        self.data_manager = DataManager()
-        self.is_trained = False
-        self._initialize_model()
+        self.data_manager = data_manager if data_manager is not None else DataManager()
+        self._is_trained = False
+        self._model_ready = False
+        # Fitted scaler parameters as float32 arrays, for transforms without sklearn's validation
+        self._scaler_mean: Optional[np.ndarray] = None
+        self._scaler_inv_scale: Optional[np.ndarray] = None
+        # Linear model weights as float32, for scoring with a direct matrix-vector product
+        self._coef: Optional[np.ndarray] = None
+        self._intercept = 0.0
+        # Feedback waiting to be applied in one partial_fit call (see update_model / flush)
+        self._pending_X: List[np.ndarray] = []
+        self._pending_y: List[int] = []
+        self._pending_since = 0.0
+        self._pending_lock = threading.Lock()
+        self._rng = np.random.default_rng()
+        if not lazy:
+            self._ensure_model()
+        _instances.add(self)
+    
+    @property
+    def is_trained(self) -> bool:
+        """Whether the model has been fitted (loads the model first if it was deferred)."""
+        self._ensure_model()
+        return self._is_trained
+    
+    @is_trained.setter
+    def is_trained(self, value: bool) -> None:
+        self._is_trained = value
+    
+    def _ensure_model(self) -> None:
+        """Load or create the model the first time it is needed."""
+        if not self._model_ready:
+            self._model_ready = True
+            self._initialize_model()
     
     def _initialize_model(self) -> None:
         """Initialize the SGDClassifier and StandardScaler."""
@@ -37,22 +89,28 @@ class MusicRecommender:
             if MODEL_PATH.exists():
                 self._load_model()
             else:
-                # Create new model
-                self.model = SGDClassifier(
-                    loss='log_loss',  # For probability estimates
-                    random_state=RANDOM_STATE,
-                    learning_rate='adaptive',
-                    eta0=0.01,
-                    max_iter=1000,
-                    tol=1e-3
-                )
-                self.scaler = StandardScaler()
-                logger.info("Initialized new SGDClassifier model")
+                self._build_fresh_model()
                 
         except Exception as e:
             logger.error(f"Error initializing model: {e}")
             raise
     
+    def _build_fresh_model(self) -> None:
+        """Create a new, untrained SGDClassifier and StandardScaler."""
+        self.model = SGDClassifier(
+            loss='log_loss',  # For probability estimates
+            random_state=RANDOM_STATE,
+            learning_rate='adaptive',
+            eta0=0.01,
+            max_iter=1000,
+            tol=1e-3
+        )
+        self.scaler = StandardScaler()
+        self.is_trained = False
+        self._cache_scaler_params()
+        self._cache_model_params()
+        logger.info("Initialized new SGDClassifier model")
+    
     def _load_model(self) -> None:
         """Load pre-trained model and scaler from disk."""
         try:
@@ -60,11 +118,31 @@ class MusicRecommender:
             self.model = model_data['model']
             self.scaler = model_data['scaler']
             self.is_trained = model_data.get('is_trained', False)
+            self._cache_scaler_params()
+            self._cache_model_params()
             logger.info("Loaded pre-trained model from disk")
         except Exception as e:
             logger.error(f"Error loading model: {e}")
-            # Fall back to new model
-            self._initialize_model()
+            # Fall back to new model (without probing MODEL_PATH again)
+            self._build_fresh_model()
+    
+    def _cache_scaler_params(self) -> None:
+        """Cache the fitted scaler's mean and inverse scale for the hot-path transform."""
+        if hasattr(self.scaler, 'mean_'):
+            self._scaler_mean = self.scaler.mean_.astype(np.float32)
+            self._scaler_inv_scale = (1.0 / self.scaler.scale_).astype(np.float32)
+        else:
+            self._scaler_mean = None
+            self._scaler_inv_scale = None
+    
+    def _cache_model_params(self) -> None:
+        """Cache the fitted model's coefficients and intercept for direct scoring."""
+        if hasattr(self.model, 'coef_'):
+            self._coef = self.model.coef_.ravel().astype(np.float32)
+            self._intercept = float(self.model.intercept_[0])
+        else:
+            self._coef = None
+            self._intercept = 0.0
     
     def _save_model(self) -> None:
         """Save model and scaler to disk."""
@@ -84,10 +162,10 @@ class MusicRecommender:
         feedback_df = self.data_manager.load_feedback_data()
         
         if feedback_df.empty:
-            return np.array([]).reshape(0, len(AUDIO_FEATURES)), np.array([])
+            return np.array([]).reshape(0, N_AUDIO_FEATURES), np.array([])
         
         # Extract features and labels
-        X = feedback_df[AUDIO_FEATURES].values
+        X = feedback_df[AUDIO_FEATURES].to_numpy(dtype=np.float64)  # Stored as float32; sklearn trains in float64
         y = feedback_df['feedback'].values
         
         return X, y
@@ -95,6 +173,7 @@ class MusicRecommender:
     def train_initial_model(self, songs_data: Dict[str, Dict], sample_size: int = 20) -> None:
         """Train initial model with synthetic data if no user feedback exists."""
         try:
+            self._ensure_model()
             X, y = self._prepare_training_data()
             
             if len(X) == 0:
@@ -104,10 +183,12 @@ class MusicRecommender:
             if len(X) > 0:
                 # Fit scaler on all data
                 self.scaler.fit(X)
+                self._cache_scaler_params()
                 X_scaled = self.scaler.transform(X)
                 
                 # Train model
                 self.model.fit(X_scaled, y)
+                self._cache_model_params()
                 self.is_trained = True
                 self._save_model()
                 
@@ -120,119 +201,169 @@ class MusicRecommender:
     
     def _create_synthetic_training_data(self, songs_data: Dict[str, Dict], sample_size: int) -> Tuple[np.ndarray, np.ndarray]:
         """Create synthetic training data for initial model."""
-        features_list = []
-        labels_list = []
+        # Rows of the songs with audio features, as indexed by the data manager
+        _, features = self.data_manager.get_song_features_batch(songs_data)
+        sample_size = min(sample_size, len(features))
         
-        # Get songs with audio features
-        songs_with_features = [
-            (sid, data) for sid, data in songs_data.items() 
-            if 'audio_features' in data
-        ]
+        # Create balanced synthetic data
+        rng = np.random.default_rng(RANDOM_STATE)
+        selected_songs = rng.choice(len(features), size=sample_size, replace=False, shuffle=False)
+        X = features[selected_songs].astype(np.float64)
         
-        if len(songs_with_features) < sample_size:
-            sample_size = len(songs_with_features)
+        # Create balanced labels (50% like, 50% dislike)
+        y = np.zeros(sample_size, dtype=np.int8)
+        y[:sample_size // 2] = 1
         
-        # Create balanced synthetic data
-        np.random.seed(RANDOM_STATE)
-        selected_songs = np.random.choice(len(songs_with_features), sample_size, replace=False)
+        return X, y
+    
+    def scale_features(self, features: np.ndarray) -> np.ndarray:
+        """Standardize raw feature rows with the fitted scaler.
         
-        for i, idx in enumerate(selected_songs):
-            _, song_data = songs_with_features[idx]
-            features = [song_data['audio_features'].get(feature, 0) for feature in AUDIO_FEATURES]
-            features_list.append(features)
-            
-            # Create balanced labels (50% like, 50% dislike)
-            labels_list.append(1 if i < sample_size // 2 else 0)
+        The scaler is fit once in ``train_initial_model`` and frozen afterwards, so callers can
+        scale the catalog once and reuse the result for every prediction and update.
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if not self.is_trained or self._scaler_mean is None:
+            return features
         
-        return np.array(features_list), np.array(labels_list)
+        # Same math as StandardScaler.transform: (x - mean_) / scale_, into one output buffer
+        scaled = np.subtract(features, self._scaler_mean)
+        np.multiply(scaled, self._scaler_inv_scale, out=scaled)
+        return scaled
     
-    def update_model(self, song_features: np.ndarray, feedback: int) -> None:
-        """Update model with new user feedback using incremental learning."""
+    def update_model(self, song_features_scaled: np.ndarray, feedback: int) -> None:
+        """Queue new user feedback (features already passed through scale_features) for the next model update.
+        
+        Samples are applied in batches of UPDATE_BATCH_SIZE, or once the oldest one has waited
+        UPDATE_FLUSH_SECONDS; call flush() to apply them immediately.
+        """
         try:
             if not self.is_trained:
                 logger.warning("Model not trained yet, cannot update")
                 return
             
-            # Scale features
-            song_features_scaled = self.scaler.transform(song_features)
+            with self._pending_lock:
+                if not self._pending_y:
+                    self._pending_since = time.monotonic()
+                self._pending_X.append(np.asarray(song_features_scaled).ravel())
+                self._pending_y.append(feedback)
+                due = len(self._pending_y) >= UPDATE_BATCH_SIZE or self._pending_expired()
+            
+            if due:
+                self.flush()
             
-            # Update model with partial_fit
-            self.model.partial_fit(song_features_scaled, [feedback])
+        except Exception as e:
+            logger.error(f"Error updating model: {e}")
+    
+    def _pending_expired(self) -> bool:
+        """Whether the oldest queued sample has waited UPDATE_FLUSH_SECONDS (call with the lock held)."""
+        return bool(self._pending_y) and time.monotonic() - self._pending_since >= UPDATE_FLUSH_SECONDS
+    
+    def flush_if_due(self) -> None:
+        """Apply queued feedback once the oldest sample has waited UPDATE_FLUSH_SECONDS, even without new feedback."""
+        with self._pending_lock:
+            due = self._pending_expired()
+        if due:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Apply all queued feedback in one incremental update and save the model."""
+        try:
+            with self._pending_lock:
+                if not self._pending_y:
+                    return
+                
+                # SGD keeps float64 weights, so train on a float64 batch
+                X = np.asarray(self._pending_X, dtype=np.float64)
+                
+                # One incremental update for the whole batch; classes lets partial_fit be used on any model state.
+                # The queue is only cleared once the update succeeds, so a failed fit keeps the feedback
+                self.model.partial_fit(X, self._pending_y, classes=_CLASSES)
+                self._cache_model_params()
+                n_samples = len(self._pending_y)
+                self._pending_X, self._pending_y = [], []
             
             # Save updated model
             self._save_model()
             
-            logger.info(f"Model updated with feedback: {feedback}")
+            logger.info(f"Model updated with {n_samples} feedback samples")
             
         except Exception as e:
             logger.error(f"Error updating model: {e}")
     
-    def predict_preferences(self, songs_data: Dict[str, Dict], exclude_ids: List[str] = None) -> List[Tuple[str, float]]:
-        """Predict user preferences for songs and return ranked recommendations."""
+    def predict_preferences(self, feat_matrix: np.ndarray, song_ids: np.ndarray, exclude_mask: Optional[np.ndarray] = None,
+                            top_k: int = MAX_RECOMMENDATIONS) -> List[Tuple[str, float]]:
+        """Score the catalog feature matrix (already passed through scale_features) and return the top_k recommendations.
+        
+        ``exclude_mask`` is a boolean array aligned with ``song_ids``; songs flagged True are skipped.
+        A ``top_k`` of 0 or less returns no recommendations.
+        """
+        if top_k <= 0:
+            return []
+        
         try:
             if not self.is_trained:
                 logger.warning("Model not trained yet, returning random recommendations")
-                return self._get_random_recommendations(songs_data, exclude_ids)
-            
-            if exclude_ids is None:
-                exclude_ids = []
+                return self._get_random_recommendations(song_ids, exclude_mask, top_k)
             
-            # Prepare features for prediction
-            song_ids, features_matrix = self.data_manager.get_song_features_batch(songs_data)
-            
-            if len(features_matrix) == 0:
+            if len(feat_matrix) == 0:
                 return []
             
             # Filter out excluded songs
-            filtered_indices = [i for i, sid in enumerate(song_ids) if sid not in exclude_ids]
-            if not filtered_indices:
+            candidates = ~exclude_mask if exclude_mask is not None else np.ones(len(song_ids), dtype=bool)
+            if not candidates.any():
                 return []
             
-            filtered_song_ids = [song_ids[i] for i in filtered_indices]
-            filtered_features = features_matrix[filtered_indices]
+            filtered_song_ids = song_ids[candidates]
+            features_scaled = feat_matrix[candidates]
             
-            # Scale features and predict
-            features_scaled = self.scaler.transform(filtered_features)
+            # Linear decision scores (X @ coef + intercept) in one BLAS call; the logistic
+            # is monotonic, so ranking on these matches ranking on predict_proba
+            scores = features_scaled @ self._coef + self._intercept
             
-            # Get prediction probabilities
-            if hasattr(self.model, 'predict_proba'):
-                probabilities = self.model.predict_proba(features_scaled)
-                # Get probability of positive class (like)
-                scores = probabilities[:, 1] if probabilities.shape[1] > 1 else probabilities[:, 0]
-            else:
-                # Fallback to decision function
-                scores = self.model.decision_function(features_scaled)
+            # Partial sort: find the k-th best score in O(N), keep everything above it plus the
+            # earliest songs that tie with it, then order only those (ties broken by catalog order)
+            k = min(top_k, len(scores))
+            kth_score = -np.partition(-scores, k - 1)[k - 1]
+            above = np.flatnonzero(scores > kth_score)
+            tied = np.flatnonzero(scores == kth_score)[:k - len(above)]
+            top = np.concatenate((above, tied))
+            order = top[np.lexsort((top, -scores[top]))]
             
-            # Create ranked recommendations
-            recommendations = list(zip(filtered_song_ids, scores))
-            recommendations.sort(key=lambda x: x[1], reverse=True)
+            # Report like-probabilities (the log_loss logistic) for the selected songs only
+            probabilities = 1.0 / (1.0 + np.exp(-scores[order].astype(np.float64)))
+            recommendations = list(zip(filtered_song_ids[order], probabilities))
             
             logger.info(f"Generated {len(recommendations)} recommendations")
             return recommendations
             
         except Exception as e:
             logger.error(f"Error predicting preferences: {e}")
-            return self._get_random_recommendations(songs_data, exclude_ids)
+            return self._get_random_recommendations(song_ids, exclude_mask, top_k)
     
-    def _get_random_recommendations(self, songs_data: Dict[str, Dict], exclude_ids: List[str] = None) -> List[Tuple[str, float]]:
+    def _get_random_recommendations(self, song_ids: np.ndarray, exclude_mask: Optional[np.ndarray] = None,
+                                    top_k: int = MAX_RECOMMENDATIONS) -> List[Tuple[str, float]]:
         """Fallback method to get random recommendations."""
-        if exclude_ids is None:
-            exclude_ids = []
+        available = np.flatnonzero(~exclude_mask) if exclude_mask is not None else np.arange(len(song_ids))
+        k = max(min(top_k, len(available)), 0)
         
-        available_songs = [sid for sid in songs_data.keys() if sid not in exclude_ids]
-        np.random.shuffle(available_songs)
-        
-        # Return with random scores
-        return [(sid, np.random.random()) for sid in available_songs[:10]]
+        # Sample only the k songs needed, with random scores drawn in one call
+        picked = self._rng.choice(available, size=k, replace=False)
+        scores = self._rng.random(k)
+        return [(song_ids[i], float(score)) for i, score in zip(picked, scores)]
     
     def get_model_stats(self) -> Dict:
         """Get statistics about the current model."""
+        self._ensure_model()
         feedback_df = self.data_manager.load_feedback_data()
         
+        # Count likes and dislikes in a single pass over the feedback column
+        counts = feedback_df['feedback'].value_counts() if not feedback_df.empty else {}
+        
         return {
             'is_trained': self.is_trained,
             'total_feedback': len(feedback_df),
-            'positive_feedback': len(feedback_df[feedback_df['feedback'] == 1]) if not feedback_df.empty else 0,
-            'negative_feedback': len(feedback_df[feedback_df['feedback'] == 0]) if not feedback_df.empty else 0,
+            'positive_feedback': int(counts.get(1, 0)),
+            'negative_feedback': int(counts.get(0, 0)),
             'model_type': type(self.model).__name__ if self.model else None
         }
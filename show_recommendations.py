@@ -3,10 +3,8 @@ Show current recommendations and model predictions.
 """
 
 from dotenv import load_dotenv
-from spotify_client import SpotifyClient
 from music_recommender import MusicRecommender
 from data_manager import DataManager
-import pandas as pd
 
 def show_current_recommendations():
     """Display current recommendations and model state."""
@@ -16,18 +14,18 @@ def show_current_recommendations():
     # Load environment variables
     load_dotenv()
     
-    # Initialize components
+    # Initialize components (one shared data manager; the model loads only if needed)
     data_manager = DataManager()
-    recommender = MusicRecommender()
-    spotify_client = SpotifyClient()
+    recommender = MusicRecommender(data_manager=data_manager, lazy=True)
     
     # Load feedback data
     feedback_df = data_manager.load_feedback_data()
     print(f"📊 Your Rating History:")
     print(f"   Total songs rated: {len(feedback_df)}")
     if not feedback_df.empty:
-        likes = len(feedback_df[feedback_df['feedback'] == 1])
-        dislikes = len(feedback_df[feedback_df['feedback'] == 0])
+        counts = feedback_df['feedback'].value_counts()
+        likes = int(counts.get(1, 0))
+        dislikes = int(counts.get(0, 0))
         print(f"   👍 Likes: {likes}")
         print(f"   👎 Dislikes: {dislikes}")
         print(f"   📈 Like ratio: {likes/(likes+dislikes)*100:.1f}%")
@@ -46,15 +44,17 @@ def show_current_recommendations():
     unrated_songs = {sid: data for sid, data in songs_data.items() if sid not in rated_song_ids}
     print(f"   Unrated songs: {len(unrated_songs)}")
     
-    # Get recommendations
-    if recommender.is_trained and unrated_songs:
+    # Get recommendations (only now is the lazily created model loaded, and only if there is something to rank)
+    if unrated_songs and recommender.is_trained:
         print(f"\n🤖 AI Model Status:")
         stats = recommender.get_model_stats()
         print(f"   Model trained: {'✅' if stats['is_trained'] else '❌'}")
         print(f"   Training data: {stats['total_feedback']} samples")
         
         print(f"\n🎯 Top 10 Recommendations:")
-        recommendations = recommender.predict_preferences(songs_data, exclude_ids=list(rated_song_ids))
+        song_ids, feat_matrix = data_manager.get_song_features_batch(songs_data)
+        rated_mask = data_manager.build_exclude_mask(song_ids, rated_song_ids)
+        recommendations = recommender.predict_preferences(recommender.scale_features(feat_matrix), song_ids, exclude_mask=rated_mask, top_k=10)
         
         for i, (song_id, score) in enumerate(recommendations[:10], 1):
             song = songs_data[song_id]
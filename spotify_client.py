@@ -2,36 +2,158 @@
 Spotify API client for the Persona music recommendation system.
 """
 
+import numpy as np
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.cache_handler import CacheFileHandler
+from spotipy.exceptions import SpotifyException
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 from typing import Dict, List, Optional, Tuple
+import json
+import os
 import random
+import sqlite3
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from itertools import islice
+from operator import itemgetter
+
+try:
+    import orjson  # Faster JSON encoding/decoding for the lookup cache
+except ImportError:
+    orjson = None
 
 from config import (
     DEFAULT_SEARCH_LIMIT,
-    AUDIO_FEATURES,
-    FALLBACK_FEATURES
+    SPOTIFY_MARKET,
+    SPOTIFY_MAX_WORKERS,
+    SPOTIFY_RATE_LIMIT,
+    SPOTIFY_RATE_PERIOD_SECONDS,
+    SPOTIFY_CACHE_PATH,
+    SPOTIFY_CACHE_TTL_HOURS,
+    SPOTIFY_TOKEN_CACHE_DIR,
+    PREFETCH_BATCH_SIZE,
+    AUDIO_FEATURE_NAMES,
+    FALLBACK_FEATURES,
+    feature_values
 )
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tables of the local lookup cache, keyed by Spotify track ID
+_CACHE_TABLES = ('audio_features', 'tracks')
+_CACHE_QUERY_CHUNK = 500  # Stay under SQLite's bound-parameter limit
+
+# Bound once: joins artist names read with a C-level getter
+_join = ', '.join
+_get_name = itemgetter('name')
+
+
+def _dumps(obj) -> bytes:
+    """Serialize a cache entry to JSON bytes."""
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode('utf-8')
+
+
+def _loads(data: bytes):
+    """Deserialize a cache entry from JSON bytes."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class _RateLimiter:
+    """Sliding-window limiter: at most max_calls per period seconds, blocking only once the window is full."""
+
+    def __init__(self, max_calls: int, period: float):
+        self._max_calls = max_calls
+        self._period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait (only if needed) for a free slot, then record a call."""
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self._period:
+                    self._calls.popleft()
+                if len(self._calls) < self._max_calls:
+                    self._calls.append(now)
+                    return
+                time.sleep(self._period - (now - self._calls[0]))
+
+
+class _TokenFileCache(CacheFileHandler):
+    """Token cache file shared across runs, written atomically and tolerant of a corrupt file."""
+
+    def get_cached_token(self):
+        try:
+            return super().get_cached_token()
+        except ValueError:
+            logger.warning(f"Ignoring unreadable token cache at {self.cache_path}")
+            return None
+
+    def save_token_to_cache(self, token_info):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            # Owner-only permissions: the file holds a live access token
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(token_info))
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Couldn't write token cache at {self.cache_path}: {e}")
+
+
+class _OrjsonSession(requests.Session):
+    """requests.Session whose responses decode JSON with orjson (spotipy parses every reply via response.json())."""
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        # orjson.JSONDecodeError subclasses ValueError, which is what spotipy handles for empty bodies
+        response.json = lambda **_: orjson.loads(response.content)
+        return response
+
+
+def _join_artist_names(artists: List[Dict]) -> str:
+    """Join a track's artist names for display, e.g. "Artist A, Artist B"."""
+    return _join(map(_get_name, artists))
+
+
+def _extract_audio_features(features: Dict) -> Dict:
+    """Keep only the AUDIO_FEATURES of an audio-features response entry, with 0 for any that are missing."""
+    return dict(zip(AUDIO_FEATURE_NAMES, feature_values(features)))
+
 
 class SpotifyClient:
     """Handles all Spotify API interactions for music data and audio features."""
     
+    # Set once the audio-features endpoint answers 403 (app lacks access); it won't change
+    # for the rest of the process, so later lookups go straight to cache/fallback features
+    _audio_features_blocked = False
+    
     def __init__(self):
         self.sp = None
+        self._session = None
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        # Rate limiting - be nice to Spotify API
+        self._rate_limiter = _RateLimiter(SPOTIFY_RATE_LIMIT, SPOTIFY_RATE_PERIOD_SECONDS)
+        # Background worker for prefetching the next batch of songs
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spotify-prefetch")
         self._initialize_client()
+        self._open_cache()
     
     def _initialize_client(self) -> None:
         """Initialize Spotify client with credentials."""
         try:
             # Get credentials from environment (reload in case they weren't loaded at import)
-            import os
             from dotenv import load_dotenv
             load_dotenv()
 
@@ -41,25 +163,120 @@ class SpotifyClient:
             if not client_id or not client_secret:
                 raise ValueError("Spotify credentials not found. Please check your .env file.")
             
+            # One pooled keep-alive session for the token endpoint and every API call,
+            # sized for the concurrent batch/search workers
+            self._session = _OrjsonSession() if orjson is not None else requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=20,
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.3,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=frozenset(['GET', 'POST'])
+                )
+            )
+            self._session.mount("https://", adapter)
+            
+            # Tokens stay valid for an hour, so reuse the last one across runs (one file per app)
+            token_cache = _TokenFileCache(cache_path=str(SPOTIFY_TOKEN_CACHE_DIR / f"spotify_token-{client_id}.json"))
             client_credentials_manager = SpotifyClientCredentials(
                 client_id=client_id,
-                client_secret=client_secret
+                client_secret=client_secret,
+                cache_handler=token_cache,
+                requests_session=self._session
             )
             
-            self.sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+            self.sp = spotipy.Spotify(
+                client_credentials_manager=client_credentials_manager,
+                requests_session=self._session
+            )
             
-            # Test the connection
-            self.sp.search(q="test", type="track", limit=1)
+            # Credentials are checked by the first real request; an up-front probe search
+            # costs a round-trip on every construction, so it only runs when asked for
+            if os.getenv("SPOTIFY_VERIFY_ON_INIT"):
+                self.sp.search(q="test", type="track", limit=1)
             logger.info("Spotify client initialized successfully")
             
         except Exception as e:
             logger.error(f"Failed to initialize Spotify client: {e}")
             raise
     
-    def search_songs(self, query: str = "popular", limit: int = DEFAULT_SEARCH_LIMIT) -> Dict[str, Dict]:
+    def _open_cache(self) -> None:
+        """Open (creating if needed) the on-disk cache of track and audio-feature lookups."""
+        try:
+            self._cache = sqlite3.connect(SPOTIFY_CACHE_PATH, check_same_thread=False)
+            for table in _CACHE_TABLES:
+                self._cache.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, json BLOB, fetched_at INTEGER)"
+                )
+            self._cache.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Lookup cache unavailable, all lookups will use the API: {e}")
+            self._cache = None
+    
+    def _cache_get(self, table: str, song_ids: List[str]) -> Dict[str, Dict]:
+        """Return the unexpired cached entries of ``table`` for ``song_ids``."""
+        if self._cache is None or not song_ids:
+            return {}
+        
+        min_fetched_at = int(time.time()) - SPOTIFY_CACHE_TTL_HOURS * 3600
+        hits = {}
+        try:
+            with self._cache_lock:
+                for i in range(0, len(song_ids), _CACHE_QUERY_CHUNK):
+                    chunk = song_ids[i:i + _CACHE_QUERY_CHUNK]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = self._cache.execute(
+                        f"SELECT id, json FROM {table} WHERE fetched_at >= ? AND id IN ({placeholders})",
+                        (min_fetched_at, *chunk)
+                    )
+                    hits.update((song_id, _loads(data)) for song_id, data in rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading lookup cache: {e}")
+        return hits
+    
+    def _cache_put(self, table: str, entries: Dict[str, Dict]) -> None:
+        """Store ``entries`` (song ID -> JSON-able dict) in ``table``."""
+        if self._cache is None or not entries:
+            return
+        
+        fetched_at = int(time.time())
+        try:
+            with self._cache_lock:
+                self._cache.executemany(
+                    f"INSERT OR REPLACE INTO {table} (id, json, fetched_at) VALUES (?, ?, ?)",
+                    [(song_id, _dumps(entry), fetched_at) for song_id, entry in entries.items()]
+                )
+                self._cache.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing lookup cache: {e}")
+    
+    def close(self) -> None:
+        """Close the prefetch worker, the pooled HTTP session and the lookup cache."""
+        executor = getattr(self, '_prefetch_executor', None)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._prefetch_executor = None
+        
+        session = getattr(self, '_session', None)  # May be missing if __init__ did not run to completion
+        if session is not None:
+            session.close()
+            self._session = None
+        
+        cache = getattr(self, '_cache', None)
+        if cache is not None:
+            cache.close()
+            self._cache = None
+    
+    def __del__(self):
+        self.close()
+    
+    def search_songs(self, query: str = "popular", limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0) -> Dict[str, Dict]:
         """Search for songs and return with basic metadata."""
         try:
-            results = self.sp.search(q=query, type="track", limit=limit)
+            self._rate_limiter.acquire()
+            results = self.sp.search(q=query, type="track", limit=limit, offset=offset, market=SPOTIFY_MARKET)
             songs_data = {}
             
             for track in results['tracks']['items']:
@@ -67,7 +284,7 @@ class SpotifyClient:
                 songs_data[song_id] = {
                     'id': song_id,
                     'name': track['name'],
-                    'artist': ', '.join([artist['name'] for artist in track['artists']]),
+                    'artist': _join_artist_names(track['artists']),
                     'album': track['album']['name'],
                     'preview_url': track['preview_url'],  # Can be None
                     'external_url': track['external_urls']['spotify'],
@@ -82,60 +299,95 @@ class SpotifyClient:
             logger.error(f"Error searching songs: {e}")
             return {}
     
-    def get_audio_features(self, song_ids: List[str]) -> Dict[str, Dict]:
-        """Get audio features for multiple songs."""
+    def _fetch_audio_features_batch(self, batch_ids: List[str]) -> Dict[str, Dict]:
+        """Fetch audio features for a single batch of at most 100 song IDs (None for tracks that have none)."""
+        self._rate_limiter.acquire()
         try:
-            # Spotify API allows max 100 IDs per request
-            batch_size = 100
-            all_features = {}
-
-            for i in range(0, len(song_ids), batch_size):
-                batch_ids = song_ids[i:i + batch_size]
-                features_response = self.sp.audio_features(batch_ids)
-
-                for features in features_response:
-                    if features:  # Some tracks might not have audio features
-                        song_id = features['id']
-                        # Extract only the features we need
-                        audio_features = {}
-                        for feature in AUDIO_FEATURES:
-                            audio_features[feature] = features.get(feature, 0)
+            features_response = self.sp.audio_features(batch_ids)
+        except SpotifyException as e:
+            if e.http_status == 403:
+                type(self)._audio_features_blocked = True
+            raise
+        batch_features = {}
 
-                        all_features[song_id] = audio_features
+        for song_id, features in zip(batch_ids, features_response):
+            # Some tracks have no audio features; they map to None, which is cached as well
+            # so those tracks aren't requested again
+            batch_features[song_id] = _extract_audio_features(features) if features else None
 
-                # Rate limiting - be nice to Spotify API
-                if len(song_ids) > batch_size:
-                    time.sleep(0.1)
+        return batch_features
 
-            logger.info(f"Retrieved audio features for {len(all_features)} songs")
-            return all_features
+    def get_audio_features(self, song_ids: List[str]) -> Dict[str, Dict]:
+        """Get audio features for multiple songs, from the lookup cache or in concurrent 100-ID batches.
+        
+        Batches are merged as they complete, so a failure part-way keeps the ones that already arrived.
+        """
+        # Audio features never change for a track ID, so only cache misses go to the API
+        all_features = self._cache_get('audio_features', song_ids)
+        cached_count = len(all_features)
+        try:
+            if not type(self)._audio_features_blocked:
+                # Spotify API allows max 100 IDs per request
+                batch_size = 100
+                missing_ids = [song_id for song_id in song_ids if song_id not in all_features]
+                batches = [missing_ids[i:i + batch_size] for i in range(0, len(missing_ids), batch_size)]
+
+                if len(batches) <= 1:
+                    for batch_ids in batches:
+                        batch_features = self._fetch_audio_features_batch(batch_ids)
+                        self._cache_put('audio_features', batch_features)
+                        all_features.update(batch_features)
+                else:
+                    with ThreadPoolExecutor(max_workers=SPOTIFY_MAX_WORKERS) as executor:
+                        futures = [executor.submit(self._fetch_audio_features_batch, ids) for ids in batches]
+                        try:
+                            for future in as_completed(futures):
+                                batch_features = future.result()
+                                self._cache_put('audio_features', batch_features)
+                                all_features.update(batch_features)
+                        finally:
+                            # Don't start the remaining batches once one has failed
+                            for future in futures:
+                                future.cancel()
 
         except Exception as e:
             logger.warning(f"Audio features not available (403 error - app permissions): {e}")
             logger.info("Falling back to basic song metadata for recommendations")
-            return {}
+
+        # Leave out the tracks Spotify has no audio features for
+        audio_features = {song_id: features for song_id, features in all_features.items() if features is not None}
+        logger.info(f"Retrieved audio features for {len(audio_features)} songs ({cached_count} lookups cached)")
+        return audio_features
     
     def get_song_with_features(self, song_id: str) -> Optional[Dict]:
         """Get complete song data including audio features."""
         try:
-            # Get track info
-            track = self.sp.track(song_id)
+            # Get track info (from the lookup cache when possible)
+            track = self._cache_get('tracks', [song_id]).get(song_id)
+            if track is None:
+                self._rate_limiter.acquire()
+                track = self.sp.track(song_id, market=SPOTIFY_MARKET)
+                self._cache_put('tracks', {song_id: track})
             
             if not track['preview_url']:
                 return None
             
             # Get audio features
-            features_response = self.sp.audio_features([song_id])
-            audio_features = {}
-            
-            if features_response and features_response[0]:
-                for feature in AUDIO_FEATURES:
-                    audio_features[feature] = features_response[0].get(feature, 0)
+            cached_features = self._cache_get('audio_features', [song_id])
+            if song_id in cached_features:
+                audio_features = cached_features[song_id] or {}
+            else:
+                audio_features = {}
+                
+                if not type(self)._audio_features_blocked:
+                    fetched_features = self._fetch_audio_features_batch([song_id])
+                    audio_features = fetched_features.get(song_id) or {}
+                    self._cache_put('audio_features', fetched_features)
             
             song_data = {
                 'id': song_id,
                 'name': track['name'],
-                'artist': ', '.join([artist['name'] for artist in track['artists']]),
+                'artist': _join_artist_names(track['artists']),
                 'album': track['album']['name'],
                 'preview_url': track['preview_url'],
                 'external_url': track['external_urls']['spotify'],
@@ -150,38 +402,36 @@ class SpotifyClient:
             logger.error(f"Error getting song with features: {e}")
             return None
 
-    def get_diverse_songs(self, genres: List[str] = None, limit: int = DEFAULT_SEARCH_LIMIT) -> Dict[str, Dict]:
-        """Get a diverse set of songs from different genres and time periods."""
+    def get_diverse_songs(self, genres: List[str] = None, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0) -> Dict[str, Dict]:
+        """Get a diverse set of songs from different genres and time periods, starting each search ``offset`` results in."""
         if genres is None:
             genres = ['pop', 'rock', 'hip-hop', 'electronic', 'indie', 'jazz', 'classical', 'country']
 
         all_songs = {}
-        songs_per_genre = max(1, limit // len(genres))
-
-        for genre in genres:
-            try:
-                # Search with different strategies for diversity
-                queries = [
-                    f"genre:{genre}",
-                    f"genre:{genre} year:2020-2024",
-                    f"genre:{genre} year:2010-2019",
-                    f"genre:{genre} year:2000-2009"
-                ]
-
-                for query in queries:
-                    if len(all_songs) >= limit:
-                        break
-
-                    songs = self.search_songs(query, limit=songs_per_genre)
+        # Round up (Spotify caps a search page at 50) so one query per genre can fill the request
+        songs_per_genre = min(50, max(1, -(-limit // len(genres))))
+        # Spotify rejects searches that reach past the 1000th result
+        offset = max(0, min(offset, 1000 - songs_per_genre))
+
+        # Search with different strategies for diversity
+        query_templates = [
+            "genre:{genre}",
+            "genre:{genre} year:2020-2024",
+            "genre:{genre} year:2010-2019",
+            "genre:{genre} year:2000-2009"
+        ]
+
+        # Each wave runs one query strategy for every genre concurrently; later waves only run
+        # while more songs are needed (genre order is kept when merging results)
+        with ThreadPoolExecutor(max_workers=SPOTIFY_MAX_WORKERS) as executor:
+            for template in query_templates:
+                if len(all_songs) >= limit:
+                    break
+
+                queries = [template.format(genre=genre) for genre in genres]
+                for songs in executor.map(lambda query: self.search_songs(query, limit=songs_per_genre, offset=offset), queries):
                     all_songs.update(songs)
 
-                    if len(all_songs) >= limit:
-                        break
-
-            except Exception as e:
-                logger.warning(f"Error searching genre {genre}: {e}")
-                continue
-
         # Limit to requested number
         if len(all_songs) > limit:
             song_ids = list(all_songs.keys())
@@ -190,57 +440,71 @@ class SpotifyClient:
 
         return all_songs
 
-    def create_fallback_features(self, song_data: Dict) -> Dict:
-        """Create fallback features from basic song metadata when audio features aren't available."""
-        fallback_features = {}
+    def fetch_enriched_songs(self, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0) -> Dict[str, Dict]:
+        """Get a diverse set of songs with their audio features attached."""
+        songs_data = self.get_diverse_songs(limit=limit, offset=offset)
+        return self.enrich_songs_with_features(songs_data) if songs_data else {}
 
-        # Normalize popularity (0-100) to 0-1 range
-        fallback_features['popularity'] = song_data.get('popularity', 50) / 100.0
+    def prefetch_next(self, n: int = PREFETCH_BATCH_SIZE, offset: int = 0) -> Future:
+        """Start fetching the next ``n`` enriched songs in the background and return their Future."""
+        return self._prefetch_executor.submit(self.fetch_enriched_songs, n, offset)
 
-        # Normalize duration (typical range 30s-600s) to 0-1 range
-        duration_ms = song_data.get('duration_ms', 180000)  # Default 3 minutes
-        fallback_features['duration_normalized'] = min(duration_ms / 600000, 1.0)
-
-        # Convert explicit to numeric
-        fallback_features['explicit'] = 1.0 if song_data.get('explicit', False) else 0.0
+    def create_fallback_features(self, song_data: Dict) -> Dict:
+        """Create fallback features from basic song metadata when audio features aren't available."""
+        return self.create_fallback_features_batch({None: song_data})[None]
 
-        # Add some synthetic features based on metadata
-        # These are rough approximations but better than nothing
-        popularity = song_data.get('popularity', 50)
-        fallback_features['energy_estimate'] = min(popularity / 80.0, 1.0)  # Popular songs tend to be energetic
-        fallback_features['danceability_estimate'] = 0.5  # Neutral default
-        fallback_features['valence_estimate'] = min(popularity / 100.0, 1.0)  # Popular songs tend to be positive
+    def create_fallback_features_batch(self, songs_data: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Create fallback features for many songs at once, returning song ID -> fallback features."""
+        if not songs_data:
+            return {}
 
-        return fallback_features
+        n = len(songs_data)
+        songs = songs_data.values()
+        popularity = np.fromiter((song.get('popularity', 50) for song in songs), dtype=np.float64, count=n)
+        duration_ms = np.fromiter((song.get('duration_ms', 180000) for song in songs), dtype=np.float64, count=n)  # Default 3 minutes
+        explicit = np.fromiter((1.0 if song.get('explicit', False) else 0.0 for song in songs), dtype=np.float64, count=n)
+
+        # One array operation per feature
+        columns = {
+            # Normalize popularity (0-100) to 0-1 range
+            'popularity': popularity / 100.0,
+            # Normalize duration (typical range 30s-600s) to 0-1 range
+            'duration_normalized': np.minimum(duration_ms / 600000, 1.0),
+            'explicit': explicit,
+            # Synthetic features based on metadata: rough approximations but better than nothing
+            'energy_estimate': np.minimum(popularity / 80.0, 1.0),  # Popular songs tend to be energetic
+            'danceability_estimate': np.full(n, 0.5),  # Neutral default
+            'valence_estimate': np.minimum(popularity / 100.0, 1.0)  # Popular songs tend to be positive
+        }
+
+        names = tuple(columns)
+        rows = zip(*(values.tolist() for values in columns.values()))
+        return {song_id: dict(zip(names, row)) for song_id, row in zip(songs_data, rows)}
 
     def enrich_songs_with_features(self, songs_data: Dict[str, Dict]) -> Dict[str, Dict]:
         """Add audio features to existing song data, with fallback to basic metadata."""
         try:
-            song_ids = list(songs_data.keys())
-            audio_features = self.get_audio_features(song_ids)
-
-            # Add audio features to song data
-            for song_id, features in audio_features.items():
-                if song_id in songs_data:
-                    songs_data[song_id]['audio_features'] = features
+            audio_features = self.get_audio_features(list(songs_data))
 
-            # For songs without audio features, create fallback features
-            songs_with_features = {}
+            # One pass attaching real audio features, collecting the songs that still need some
+            needs_fallback = {}
             for song_id, song_data in songs_data.items():
-                if 'audio_features' in song_data:
-                    # Has real audio features
-                    songs_with_features[song_id] = song_data
-                else:
-                    # Create fallback features
-                    song_data['audio_features'] = self.create_fallback_features(song_data)
-                    songs_with_features[song_id] = song_data
+                features = audio_features.get(song_id)
+                if features is not None:
+                    song_data['audio_features'] = features
+                elif 'audio_features' not in song_data:
+                    needs_fallback[song_id] = song_data
+
+            # Fallback features for all of those in one vectorized batch
+            for song_id, features in self.create_fallback_features_batch(needs_fallback).items():
+                songs_data[song_id]['audio_features'] = features
 
             if audio_features:
                 logger.info(f"Enriched {len(audio_features)} songs with real audio features")
             else:
-                logger.info(f"Using fallback features for {len(songs_with_features)} songs (audio features not available)")
+                logger.info(f"Using fallback features for {len(songs_data)} songs (audio features not available)")
 
-            return songs_with_features
+            return songs_data
 
         except Exception as e:
             logger.error(f"Error enriching songs with features: {e}")
@@ -251,5 +515,6 @@ class SpotifyClient:
         if not songs_data:
             return None
 
-        song_id = random.choice(list(songs_data.keys()))
+        # Step to a random position instead of copying every key into a list
+        song_id = next(islice(songs_data, random.randrange(len(songs_data)), None))
         return song_id, songs_data[song_id]
@@ -0,0 +1,84 @@
+"""
+Spotify embed player helpers for the Persona music recommendation system.
+"""
+
+import re
+from functools import lru_cache
+
+# Hover effect for the embed wrapper, scoped to its class rather than every div.
+# Injected once per page run rather than inside each embed.
+EMBED_STYLE = """
+<style>
+    .persona-embed:hover {
+        transform: translateY(-2px);
+        box-shadow: 0 12px 24px rgba(0,0,0,0.2);
+    }
+</style>
+"""
+
+# Spotify track IDs are 22 base62 (ASCII alphanumeric) characters
+_TRACK_ID_RE = re.compile(r'[0-9A-Za-z]{22}')
+
+
+# Enhanced CSS for responsive iframe with better styling; filled in per track by create_spotify_embed_html
+_EMBED_TEMPLATE = """
+    <div class="persona-embed" style="
+        position: relative;
+        width: 100%;
+        height: 152px;
+        margin: 15px 0;
+        border-radius: 12px;
+        overflow: hidden;
+        box-shadow: 0 8px 16px rgba(0,0,0,0.15);
+        background: linear-gradient(135deg, #1DB954 0%, #1ed760 100%);
+        padding: 2px;
+        transition: transform 0.2s ease, box-shadow 0.2s ease;
+    ">
+        <div style="
+            width: 100%;
+            height: 100%;
+            border-radius: 10px;
+            overflow: hidden;
+            background: white;
+        ">
+            <iframe
+                src="https://open.spotify.com/embed/track/{track_id}?utm_source=generator&theme={theme}"
+                width="100%"
+                height="152"
+                frameborder="0"
+                allowfullscreen=""
+                allow="autoplay; clipboard-write; encrypted-media; fullscreen; picture-in-picture"
+                loading="lazy"
+                style="border-radius: 10px; display: block;">
+            </iframe>
+        </div>
+    </div>
+    """
+
+
+@lru_cache(maxsize=512)
+def create_spotify_embed_html(track_id: str, theme: str = "0") -> str:
+    """
+    Create HTML for Spotify embed iframe with enhanced styling.
+
+    Args:
+        track_id: Spotify track ID
+        theme: "0" for light theme, "1" for dark theme
+    """
+    # Memoized per (track_id, theme): the same songs re-embed on every Streamlit rerun
+    return _EMBED_TEMPLATE.format_map({'track_id': track_id, 'theme': theme})
+
+
+@lru_cache(maxsize=4096)
+def _is_track_id(track_id: str) -> bool:
+    """Match a string against the track ID format, memoized since the same IDs are checked on every rerun."""
+    return _TRACK_ID_RE.fullmatch(track_id) is not None
+
+
+def validate_spotify_track_id(track_id: str) -> bool:
+    """Validate if the track ID is in correct Spotify format."""
+    # Reject empty and non-string input before the (hash-based) cache
+    if not track_id or not isinstance(track_id, str):
+        return False
+
+    return _is_track_id(track_id)
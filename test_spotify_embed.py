@@ -6,11 +6,39 @@ This script tests the embed HTML generation and validation functions.
 
 import sys
 import os
+from itertools import islice
+from pathlib import Path
 
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import create_spotify_embed_html, validate_spotify_track_id
+from spotify_embed import create_spotify_embed_html, validate_spotify_track_id
+
+# Sample pages for manual inspection of the generated embeds
+SAMPLE_LIGHT = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Spotify Embed Test - Light Theme</title>
+</head>
+<body>
+    <h1>Spotify Embed Test - Light Theme</h1>
+    {embed}
+</body>
+</html>
+"""
+
+SAMPLE_DARK = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Spotify Embed Test - Dark Theme</title>
+    <style>body {{ background-color: #121212; color: white; }}</style>
+</head>
+<body>
+    <h1>Spotify Embed Test - Dark Theme</h1>
+    {embed}
+</body>
+</html>
+"""
 
 
 def test_spotify_track_id_validation():
@@ -32,6 +60,7 @@ def test_spotify_track_id_validation():
         "this_is_way_too_long_to_be_valid_id",  # Too long
         "4uLU6hMCjMI75M1A2tKUQ!",  # Contains special character
         "4uLU6hMCjMI75M1A2tKUQ",   # Too short by 1 character
+        "4uLU6hMCjMI75M1A2tKUQé",  # Non-ASCII letter
     ]
     
     print("✅ Testing valid IDs:")
@@ -79,34 +108,8 @@ def test_embed_html_generation():
     print("✅ HTML structure validation passed!")
     
     # Save sample HTML for manual inspection
-    with open("sample_embed_light.html", "w", encoding="utf-8") as f:
-        f.write(f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Spotify Embed Test - Light Theme</title>
-</head>
-<body>
-    <h1>Spotify Embed Test - Light Theme</h1>
-    {html_light}
-</body>
-</html>
-        """)
-    
-    with open("sample_embed_dark.html", "w", encoding="utf-8") as f:
-        f.write(f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Spotify Embed Test - Dark Theme</title>
-    <style>body {{ background-color: #121212; color: white; }}</style>
-</head>
-<body>
-    <h1>Spotify Embed Test - Dark Theme</h1>
-    {html_dark}
-</body>
-</html>
-        """)
+    Path("sample_embed_light.html").write_text(SAMPLE_LIGHT.format(embed=html_light), encoding="utf-8")
+    Path("sample_embed_dark.html").write_text(SAMPLE_DARK.format(embed=html_dark), encoding="utf-8")
     
     print("✅ Sample HTML files created: sample_embed_light.html, sample_embed_dark.html")
 
@@ -124,21 +127,20 @@ def test_with_cache_data():
         if cached_songs:
             print(f"✅ Loaded {len(cached_songs)} songs from cache")
             
-            # Test with first few songs
-            test_count = 0
-            for song_id, song_data in cached_songs.items():
-                if test_count >= 3:  # Test only first 3 songs
-                    break
-                
+            # Test with first few songs: validate and build embeds up front, then report
+            sample_songs = list(islice(cached_songs.items(), 3))
+            validity = [validate_spotify_track_id(song_id) for song_id, _ in sample_songs]
+            embeds = [create_spotify_embed_html(song_id) if is_valid else None
+                      for (song_id, _), is_valid in zip(sample_songs, validity)]
+            
+            for (song_id, song_data), is_valid, html in zip(sample_songs, validity, embeds):
                 print(f"\n🎵 Testing song: {song_data['name']} by {song_data['artist']}")
                 
                 # Validate ID
-                is_valid = validate_spotify_track_id(song_id)
                 print(f"   ID validation: {'✅ Valid' if is_valid else '❌ Invalid'}")
                 
                 # Generate embed HTML
                 if is_valid:
-                    html = create_spotify_embed_html(song_id)
                     print(f"   Embed HTML: ✅ Generated ({len(html)} characters)")
                 else:
                     print(f"   Embed HTML: ❌ Skipped (invalid ID)")
@@ -146,8 +148,6 @@ def test_with_cache_data():
                 # Check preview URL availability
                 has_preview = bool(song_data.get('preview_url'))
                 print(f"   Preview URL: {'✅ Available' if has_preview else '❌ Not available'}")
-                
-                test_count += 1
             
             print("\n✅ Cache data tests completed!")
         else: